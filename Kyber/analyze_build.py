@@ -2,9 +2,13 @@
 import argparse
 import json
 import os
+import re
 import shlex
 import subprocess
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from itertools import repeat
 from pathlib import Path
 
 
@@ -36,12 +40,48 @@ def load_commands(log_path):
     return cmds
 
 
+def _walk_ext(root, ext):
+    """
+    Yield the path (as a str) of every file under root whose name ends
+    with ext. Uses os.scandir directly so no Path object or extra stat is
+    made per directory entry; symlinked directories are not followed.
+    """
+    stack = [os.fspath(root)]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    stack.append(e.path)
+                elif e.name.endswith(ext):
+                    yield e.path
+
+
 def find_elfs(root):
     """
     Find all .elf files under root.
     """
-    root = Path(root)
-    return sorted(root.rglob("*.elf"))
+    return sorted(Path(p) for p in _walk_ext(root, ".elf"))
+
+
+def index_obj_files(root):
+    """
+    Map every .o basename under root to the list of paths with that name
+    (several directories may build an object with the same name).
+    """
+    index = defaultdict(list)
+    for p in _walk_ext(root, ".o"):
+        index[os.path.basename(p)].append(p)
+    return index
+
+
+# A depfile token is a run of non-space characters where "\x" (e.g. an
+# escaped space) counts as one literal character.
+DEP_TOKEN_RE = re.compile(r"(?:\\.|[^\s\\])+")
+DEP_ESCAPE_RE = re.compile(r"\\(.)")
 
 
 def parse_depfile(path):
@@ -54,42 +94,92 @@ def parse_depfile(path):
 
     Returns a list of dependency paths (including the .c/.S source).
     """
-    text = Path(path).read_text()
+    return parse_depfile_text(Path(path).read_text())
+
+
+def parse_depfile_text(text):
+    """
+    Same as parse_depfile, for the already-read contents of a .d file.
+    """
     # Join backslash-continued lines
     text = text.replace("\\\n", " ")
     parts = text.split(":")
     if len(parts) < 2:
         return []
     deps_part = ":".join(parts[1:])
-    tokens = shlex.split(deps_part)
+    # GCC only escapes with backslashes ("\ " for a space in a path), so a
+    # regex split is enough; shlex's general quoting machinery is not needed.
+    tokens = []
+    for tok in DEP_TOKEN_RE.findall(deps_part):
+        if "\\" in tok:
+            tok = DEP_ESCAPE_RE.sub(r"\1", tok)
+        tokens.append(tok)
     return tokens
 
 
-def nm_defined_funcs(obj_or_elf, tool="riscv32-unknown-elf-nm"):
+def _read_if_exists(path):
+    """
+    Return the text of path, or None if it cannot be read.
+    """
+    try:
+        return Path(path).read_text()
+    except OSError:
+        return None
+
+
+def read_depfiles(objs, max_workers=32):
     """
-    Run 'nm' on an object or ELF and return a list of defined function names.
+    Read the .d file next to each object, in order, using a thread pool so
+    the many small blocking reads overlap. Missing files give None.
     """
+    dep_paths = [obj.with_suffix(".d") for obj in objs]
+    if len(dep_paths) <= 1:
+        return [_read_if_exists(d) for d in dep_paths]
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        return list(ex.map(_read_if_exists, dep_paths))
+
+
+def nm_defined_funcs_bulk(objs, tool="riscv32-unknown-elf-nm"):
+    """
+    Run 'nm' once over several objects/ELFs and return a dict
+    {path: [defined function names]}.
+
+    With more than one input nm prints a "path:" header line before each
+    file's symbols; with a single input there is no header, so everything
+    belongs to that one file.
+    """
+    objs = [str(o) for o in objs]
+    funcs = {o: [] for o in objs}
+    if not objs:
+        return funcs
+
     try:
+        # No check=True: nm exits non-zero if *any* input is unreadable,
+        # but still lists the symbols of the others.
         res = subprocess.run(
-            [tool, "-C", "--defined-only", obj_or_elf],
-            check=True,
+            [tool, "-C", "--defined-only", *objs],
             stdout=subprocess.PIPE,
             stderr=subprocess.DEVNULL,
             text=True,
         )
-    except (OSError, subprocess.CalledProcessError):
-        return []
+    except OSError:
+        return funcs
 
-    funcs = []
+    current = objs[0] if len(objs) == 1 else None
     for line in res.stdout.splitlines():
         line = line.strip()
         if not line:
             continue
+        if line.endswith(":") and line[:-1] in funcs:
+            current = line[:-1]
+            continue
+        if current is None:
+            continue
         parts = line.split()
         if len(parts) >= 3:
             _, typecode, name = parts[0], parts[1], parts[2]
             if typecode.upper() in ("T", "W"):
-                funcs.append(name)
+                funcs[current].append(name)
     return funcs
 
 
@@ -116,6 +206,210 @@ def parse_map_for_objects(map_path):
     return sorted(objs)
 
 
+@lru_cache(maxsize=None)
+def _sanitize(path):
+    """
+    Turn a path into a Graphviz node id. Cached because the same sources
+    and headers show up under many objects.
+    """
+    return path.replace(os.sep, "_").replace(".", "_")
+
+
+def find_map_objects(elf):
+    """
+    Locate the map file next to elf and return (map_path, object names
+    listed in it). map_path is None when there is no map file.
+    """
+    elf = elf.resolve()
+
+    # Try to find a matching map file (same dir, .map extension)
+    map_path = elf.with_suffix(elf.suffix + ".map")  # e.g. foo.elf.map
+    if not map_path.exists():
+        # fallback: foo.map
+        map_path = elf.with_suffix(".map")
+
+    if map_path.exists():
+        return map_path, parse_map_for_objects(map_path)
+    return None, []
+
+
+def _is_existing_abs(on):
+    p = Path(on)
+    return p.is_absolute() and p.exists()
+
+
+def _process_elf(elf, map_path, obj_names, all_obj_files, nm_tool, want_dot,
+                 depfile_workers=32):
+    """
+    Do all the per-ELF work (depfiles, nm) and return a plain, picklable
+    report dict so it can run in a worker process. Nothing is printed here;
+    see _print_elf_report.
+    """
+    elf = elf.resolve()
+
+    # Try to resolve object paths: map usually contains basenames or relative paths.
+    # Absolute paths that exist are used as-is; everything else is looked up
+    # in all_obj_files (built once by index_obj_files, and only if needed).
+    resolved_objs = []
+    for on in obj_names:
+        if _is_existing_abs(on):
+            resolved_objs.append(Path(on).resolve())
+            continue
+        # exact basename match
+        base = os.path.basename(on)
+        p = all_obj_files.get(base, [None])[0]
+        if p:
+            resolved_objs.append(Path(p).resolve())
+        else:
+            # best-effort: treat path as given in map
+            resolved_objs.append(Path(on).resolve())
+
+    if not resolved_objs and obj_names:
+        # In case they were all paths, not basenames
+        resolved_objs = [Path(on).resolve() for on in obj_names]
+
+    obj_to_sources = defaultdict(list)
+    source_to_headers = defaultdict(set)
+    source_to_funcs = defaultdict(list)
+
+    # Gather sources + headers from .d files
+    dep_texts = read_depfiles(resolved_objs, max_workers=depfile_workers)
+    for obj, dep_text in zip(resolved_objs, dep_texts):
+        if dep_text is not None:
+            deps = parse_depfile_text(dep_text)
+            if deps:
+                # First token often is the target (obj file); skip it if so.
+                deps = [d for d in deps if d != str(obj)]
+                headers = []
+                for d in deps:
+                    if d.endswith((".c", ".C", ".cc", ".cpp", ".S", ".s")):
+                        obj_to_sources[str(obj)].append(d)
+                    else:
+                        headers.append(d)
+                # GCC emits one primary source per object; the headers
+                # belong to it.
+                if headers and obj_to_sources[str(obj)]:
+                    primary = obj_to_sources[str(obj)][0]
+                    source_to_headers[primary].update(headers)
+
+    # Gather functions from objects (or from ELF if we have no map)
+    if nm_tool:
+        if resolved_objs:
+            obj_funcs = nm_defined_funcs_bulk(resolved_objs, nm_tool)
+            for obj in resolved_objs:
+                funcs = obj_funcs.get(str(obj), [])
+                for s in obj_to_sources.get(str(obj), []) or [None]:
+                    if s:
+                        source_to_funcs[s].extend(funcs)
+        else:
+            # Fallback: no map/objs → list functions directly from ELF
+            funcs = nm_defined_funcs_bulk([elf], nm_tool)[str(elf)]
+            if funcs:
+                source_to_funcs[str(elf)] = funcs
+
+    # ----- Graphviz fragment -----
+    dot_lines = []
+    if want_dot:
+        elf_id = _sanitize(str(elf))
+        dot_lines.append(
+            f'  "{elf_id}" [label="{elf.name}",shape=ellipse,style=filled];'
+        )
+
+        # resolved_objs are already absolute; compute each node id once
+        obj_ids = {obj: _sanitize(str(obj)) for obj in resolved_objs}
+        for obj in resolved_objs:
+            obj_id = obj_ids[obj]
+            dot_lines.append(
+                f'  "{obj_id}" [label="{obj.name}"];'
+            )
+            dot_lines.append(f'  "{obj_id}" -> "{elf_id}";')
+
+            for s in obj_to_sources.get(str(obj), []):
+                sid = _sanitize(s)
+                dot_lines.append(
+                    f'  "{sid}" [label="{os.path.basename(s)}",shape=note];'
+                )
+                dot_lines.append(f'  "{sid}" -> "{obj_id}";')
+
+    return {
+        "elf": str(elf),
+        "map_path": str(map_path) if map_path else None,
+        "objs": [str(obj) for obj in resolved_objs],
+        "obj_to_sources": dict(obj_to_sources),
+        "source_to_headers": dict(source_to_headers),
+        "source_to_funcs": dict(source_to_funcs),
+        "dot_lines": dot_lines,
+    }
+
+
+# Object index handed to each worker process once, by _init_worker,
+# instead of being pickled again with every ELF task.
+_worker_obj_files = None
+
+
+def _init_worker(all_obj_files):
+    global _worker_obj_files
+    _worker_obj_files = all_obj_files
+
+
+def _process_elf_in_worker(elf, map_path, obj_names, nm_tool, want_dot):
+    """
+    _process_elf for a pool worker. The pool already runs one worker per
+    CPU, so each worker reads its depfiles with only a few threads.
+    """
+    return _process_elf(
+        elf, map_path, obj_names, _worker_obj_files, nm_tool, want_dot,
+        depfile_workers=4,
+    )
+
+
+def _print_elf_report(report):
+    print("=" * 80)
+    print(f"ELF: {report['elf']}")
+
+    if report["map_path"]:
+        print(f"Map file: {report['map_path']}")
+    else:
+        print("Map file: (none found)")
+
+    objs = report["objs"]
+    obj_to_sources = report["obj_to_sources"]
+    source_to_headers = report["source_to_headers"]
+    source_to_funcs = report["source_to_funcs"]
+
+    if not objs:
+        print("  (No object files parsed from map; reporting will be limited.)")
+
+    # ----- Textual report -----
+    if objs:
+        for obj in objs:
+            print()
+            print(f"  Object: {obj}")
+            srcs = obj_to_sources.get(obj) or []
+            if srcs:
+                for s in srcs:
+                    print(f"    Source: {s}")
+                    headers = sorted(source_to_headers.get(s, []))
+                    if headers:
+                        print("      Headers:")
+                        for h in headers:
+                            print(f"        {h}")
+                    funcs = source_to_funcs.get(s, [])
+                    if funcs:
+                        print("      Functions (from nm):")
+                        for fn in sorted(set(funcs)):
+                            print(f"        {fn}")
+            else:
+                print("    (No .d file or could not resolve sources)")
+    else:
+        # No objects resolved; just show functions from ELF if we have them
+        if source_to_funcs:
+            print()
+            print("  Functions in ELF (no object/source mapping):")
+            for fn in sorted(set(next(iter(source_to_funcs.values())))):
+                print(f"    {fn}")
+
+
 def build_report(root, log_path, dot_path=None, nm_tool=None):
     root = Path(root)
     cmds = load_commands(log_path)
@@ -125,14 +419,6 @@ def build_report(root, log_path, dot_path=None, nm_tool=None):
         print("No .elf files found under", root)
         return
 
-    dot_lines = None
-    if dot_path:
-        dot_lines = [
-            "digraph Build {",
-            "  rankdir=LR;",
-            '  node [shape=box,fontname="Helvetica"];',
-        ]
-
     # Optional: show which make commands ran
     if cmds:
         print("Commands recorded in build_trace.jsonl:")
@@ -141,131 +427,52 @@ def build_report(root, log_path, dot_path=None, nm_tool=None):
                 print(f"  #{c['index']} @ {c['cwd']}: {' '.join(c['cmd'])}")
         print()
 
-    for elf in elfs:
-        elf = elf.resolve()
-        print("=" * 80)
-        print(f"ELF: {elf}")
-
-        # Try to find a matching map file (same dir, .map extension)
-        map_path = elf.with_suffix(elf.suffix + ".map")  # e.g. foo.elf.map
-        if not map_path.exists():
-            # fallback: foo.map
-            map_path = elf.with_suffix(".map")
-
-        if map_path.exists():
-            print(f"Map file: {map_path}")
-            obj_names = parse_map_for_objects(map_path)
-        else:
-            print("Map file: (none found)")
-            obj_names = []
-
-        # Try to resolve object paths: map usually contains basenames or relative paths.
-        # We'll search under root for matches.
-        all_obj_files = {p.name: p for p in root.rglob("*.o")}
-        resolved_objs = []
-        for on in obj_names:
-            # exact basename match
-            base = os.path.basename(on)
-            p = all_obj_files.get(base)
-            if p:
-                resolved_objs.append(p.resolve())
-            else:
-                # best-effort: treat path as given in map
-                resolved_objs.append(Path(on).resolve())
-
-        if not resolved_objs and obj_names:
-            # In case they were all paths, not basenames
-            resolved_objs = [Path(on).resolve() for on in obj_names]
-
-        if not resolved_objs:
-            print("  (No object files parsed from map; reporting will be limited.)")
-
-        obj_to_sources = defaultdict(list)
-        source_to_headers = defaultdict(set)
-        source_to_funcs = defaultdict(list)
-
-        # Gather sources + headers from .d files
-        for obj in resolved_objs:
-            dep = obj.with_suffix(".d")
-            if dep.exists():
-                deps = parse_depfile(dep)
-                if deps:
-                    # First token often is the target (obj file); skip it if so.
-                    deps = [d for d in deps if d != str(obj)]
-                    for d in deps:
-                        if d.endswith((".c", ".C", ".cc", ".cpp", ".S", ".s")):
-                            obj_to_sources[str(obj)].append(d)
-                        else:
-                            for s in obj_to_sources[str(obj)] or [None]:
-                                if s:
-                                    source_to_headers[s].add(d)
-
-        # Gather functions from objects (or from ELF if we have no map)
-        if nm_tool:
-            if resolved_objs:
-                for obj in resolved_objs:
-                    funcs = nm_defined_funcs(str(obj), nm_tool)
-                    for s in obj_to_sources.get(str(obj), []) or [None]:
-                        if s:
-                            source_to_funcs[s].extend(funcs)
-            else:
-                # Fallback: no map/objs → list functions directly from ELF
-                funcs = nm_defined_funcs(str(elf), nm_tool)
-                if funcs:
-                    source_to_funcs[str(elf)] = funcs
-
-        # ----- Textual report -----
-        if resolved_objs:
-            for obj in resolved_objs:
-                print()
-                print(f"  Object: {obj}")
-                srcs = obj_to_sources.get(str(obj)) or []
-                if srcs:
-                    for s in srcs:
-                        print(f"    Source: {s}")
-                        headers = sorted(source_to_headers.get(s, []))
-                        if headers:
-                            print("      Headers:")
-                            for h in headers:
-                                print(f"        {h}")
-                        funcs = source_to_funcs.get(s, [])
-                        if funcs:
-                            print("      Functions (from nm):")
-                            for fn in sorted(set(funcs)):
-                                print(f"        {fn}")
-                else:
-                    print("    (No .d file or could not resolve sources)")
-        else:
-            # No objects resolved; just show functions from ELF if we have them
-            if source_to_funcs:
-                print()
-                print("  Functions in ELF (no object/source mapping):")
-                for fn in sorted(set(next(iter(source_to_funcs.values())))):
-                    print(f"    {fn}")
-
-        # ----- Graphviz graph -----
-        if dot_path and dot_lines is not None:
-            elf_id = str(elf).replace(os.sep, "_").replace(".", "_")
-            dot_lines.append(
-                f'  "{elf_id}" [label="{elf.name}",shape=ellipse,style=filled];'
-            )
-
-            for obj in resolved_objs:
-                obj = obj.resolve()
-                obj_id = str(obj).replace(os.sep, "_").replace(".", "_")
-                dot_lines.append(
-                    f'  "{obj_id}" [label="{obj.name}"];'
+    # The map files are small; read them all up front so we know whether
+    # any object needs the basename index before walking the tree for it.
+    maps = [find_map_objects(elf) for elf in elfs]
+    if any(not _is_existing_abs(on) for _, names in maps for on in names):
+        # Walk the tree for object files once, not once per ELF.
+        all_obj_files = index_obj_files(root)
+    else:
+        all_obj_files = {}
+
+    # Each ELF is independent, so fan them out over a process pool and
+    # print the results in the original order. Not worth the pool start-up
+    # for a single ELF.
+    want_dot = bool(dot_path)
+    if len(elfs) == 1:
+        (map_path, obj_names), = maps
+        reports = [
+            _process_elf(elfs[0], map_path, obj_names, all_obj_files, nm_tool, want_dot)
+        ]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=os.cpu_count(),
+            initializer=_init_worker,
+            initargs=(all_obj_files,),
+        ) as ex:
+            reports = list(
+                ex.map(
+                    _process_elf_in_worker,
+                    elfs,
+                    [m for m, _ in maps],
+                    [names for _, names in maps],
+                    repeat(nm_tool),
+                    repeat(want_dot),
                 )
-                dot_lines.append(f'  "{obj_id}" -> "{elf_id}";')
+            )
 
-                for s in obj_to_sources.get(str(obj), []):
-                    sid = s.replace(os.sep, "_").replace(".", "_")
-                    dot_lines.append(
-                        f'  "{sid}" [label="{os.path.basename(s)}",shape=note];'
-                    )
-                    dot_lines.append(f'  "{sid}" -> "{obj_id}";')
+    for report in reports:
+        _print_elf_report(report)
 
-    if dot_path and dot_lines is not None:
+    if dot_path:
+        dot_lines = [
+            "digraph Build {",
+            "  rankdir=LR;",
+            '  node [shape=box,fontname="Helvetica"];',
+        ]
+        for report in reports:
+            dot_lines.extend(report["dot_lines"])
         dot_lines.append("}")
         Path(dot_path).write_text("\n".join(dot_lines))
         print()
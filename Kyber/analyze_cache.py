@@ -0,0 +1,82 @@
+"""
+Small on-disk cache for the ELF analysis scripts (analyze_elf_debug.py,
+callgraph_elf.py, cryptoTool_callgraph_elf.py).
+
+Results of nm/addr2line/objdump are stored as JSON under
+~/.cache/kyber_analyze/ (or $XDG_CACHE_HOME/kyber_analyze/), keyed on the
+ELF's path, mtime, size and a hash of its first 4 KiB, plus the
+--version of every tool involved and CACHE_VERSION. Rebuilding the ELF
+or upgrading the toolchain therefore invalidates the entry automatically;
+changing how a script parses tool output must bump CACHE_VERSION.
+"""
+import hashlib
+import json
+import os
+import subprocess
+from pathlib import Path
+
+CACHE_DIR = (
+    Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+    / "kyber_analyze"
+)
+
+# Entries hold already-parsed output, so a parser change does not show up
+# in the ELF or tool versions. Bump this whenever one changes.
+CACHE_VERSION = 2
+
+_tool_versions = {}
+
+
+def tool_version(tool):
+    """
+    First line of `tool --version`, looked up once per process.
+    """
+    if tool not in _tool_versions:
+        try:
+            out = subprocess.run(
+                [tool, "--version"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+            ).stdout
+            _tool_versions[tool] = out.splitlines()[0] if out else ""
+        except OSError:
+            _tool_versions[tool] = ""
+    return _tool_versions[tool]
+
+
+def _cache_path(elf, kind, tools):
+    elf = os.path.abspath(elf)
+    st = os.stat(elf)
+    with open(elf, "rb") as f:
+        head = hashlib.sha1(f.read(4096)).hexdigest()
+    key = json.dumps(
+        [CACHE_VERSION, elf, st.st_mtime_ns, st.st_size, head, kind,
+         [(t, tool_version(t)) for t in tools]]
+    )
+    return CACHE_DIR / (hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+
+def cache_load(elf, kind, tools):
+    """
+    Return the data stored for (elf, kind, tools), or None on a miss.
+    """
+    try:
+        return json.loads(_cache_path(elf, kind, tools).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def cache_store(elf, kind, tools, data):
+    """
+    Store JSON-serializable data for (elf, kind, tools). Failures to write
+    the cache are ignored; it is only an optimization.
+    """
+    try:
+        path = _cache_path(elf, kind, tools)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(data))
+        os.replace(tmp, path)
+    except OSError:
+        pass
@@ -1,14 +1,21 @@
 #!/usr/bin/env python3
 import argparse
 import subprocess
-from collections import defaultdict
+from itertools import groupby
+from operator import itemgetter
 from pathlib import Path
 
+from analyze_cache import cache_load, cache_store
+
 
 def nm_functions(elf, nm_tool):
     """
     Return list of (addr_hex, name) for text/weak-text symbols in ELF.
     """
+    cached = cache_load(elf, "nm_functions", [nm_tool])
+    if cached is not None:
+        return [tuple(f) for f in cached]
+
     try:
         res = subprocess.run(
             [nm_tool, "-C", "--defined-only", elf],
@@ -34,41 +41,78 @@ def nm_functions(elf, nm_tool):
             # addr is already hex (e.g. 00001000)
             addr = "0x" + addr_str.lstrip("0x")
             funcs.append((addr, name))
+    cache_store(elf, "nm_functions", [nm_tool], funcs)
     return funcs
 
 
-def addr2line_info(elf, addr, addr2line_tool):
+# (elf, addr) -> (func_name, file, line), shared by every lookup in this process
+_addr2line_cache = {}
+
+
+def _split_file_line(file_line):
     """
-    Run addr2line for a single address, return (func_name, file, line).
+    Split addr2line's "path/file.c:123" (or "??:0") into (file, line).
     """
-    try:
-        res = subprocess.run(
-            [addr2line_tool, "-C", "-f", "-e", elf, addr],
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.DEVNULL,
-            text=True,
-        )
-    except (OSError, subprocess.CalledProcessError):
-        return ("??", "??", 0)
+    file, sep, line_str = file_line.rpartition(":")
+    if not sep:
+        return file_line, 0
+    line = int(line_str) if line_str.isdigit() else 0
+    return file, line
 
-    lines = res.stdout.splitlines()
-    if len(lines) < 2:
-        return ("??", "??", 0)
 
-    func_name = lines[0].strip()
-    file_line = lines[1].strip()  # "path/file.c:123" or "??:0"
+def addr2line_info_bulk(elf, addrs, addr2line_tool):
+    """
+    Resolve many addresses with a single addr2line run.
 
-    if ":" in file_line:
-        file, line_str = file_line.rsplit(":", 1)
+    Addresses are fed on stdin; with -f addr2line answers each one with
+    exactly two lines (function name, "file:line"), in input order.
+    Returns {addr: (func_name, file, line)}.
+    """
+    missing = [a for a in dict.fromkeys(addrs) if (elf, a) not in _addr2line_cache]
+    if missing:
+        # Then the on-disk cache from earlier runs on the same ELF
+        disk = cache_load(elf, "addr2line_f", [addr2line_tool]) or {}
+        for a in missing:
+            if a in disk:
+                _addr2line_cache[(elf, a)] = tuple(disk[a])
+        missing = [a for a in missing if a not in disk]
+
+    if missing:
         try:
-            line = int(line_str)
-        except ValueError:
-            line = 0
-    else:
-        file, line = file_line, 0
+            res = subprocess.run(
+                [addr2line_tool, "-C", "-f", "-e", elf],
+                input="\n".join(missing) + "\n",
+                check=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+            )
+            lines = res.stdout.splitlines()
+        except (OSError, subprocess.CalledProcessError):
+            lines = []
+
+        # Only answers addr2line actually gave go to disk; a failed run
+        # falls back to "??" for this process but is retried next time.
+        complete = len(lines) >= 2 * len(missing)
+        for i, addr in enumerate(missing):
+            if 2 * i + 1 < len(lines):
+                func_name = lines[2 * i].strip()
+                file, line = _split_file_line(lines[2 * i + 1].strip())
+                _addr2line_cache[(elf, addr)] = (func_name, file, line)
+                disk[addr] = _addr2line_cache[(elf, addr)]
+            else:
+                _addr2line_cache[(elf, addr)] = ("??", "??", 0)
+        if complete:
+            cache_store(elf, "addr2line_f", [addr2line_tool], disk)
+
+    return {a: _addr2line_cache[(elf, a)] for a in addrs}
+
 
-    return (func_name, file, line)
+def addr2line_info(elf, addr, addr2line_tool):
+    """
+    Run addr2line for a single address, return (func_name, file, line).
+    """
+    return addr2line_info_bulk(elf, [addr], addr2line_tool)[addr]
 
 
 def analyze_elf(elf_path, nm_tool, addr2line_tool):
@@ -86,30 +130,25 @@ def analyze_elf(elf_path, nm_tool, addr2line_tool):
         print("No functions found by nm (did you build with DEBUG=1 ?)")
         return
 
-    # Group by source file
-    per_file = defaultdict(list)
+    info = addr2line_info_bulk(str(elf), [addr for addr, _ in funcs], addr2line_tool)
 
+    # One flat list sorted by (file, line, addr), then grouped by file.
+    # Sometimes sym_name == func_name, sometimes not; keep both.
+    records = []
     for addr, sym_name in funcs:
-        demangled_name, file, line = addr2line_info(str(elf), addr, addr2line_tool)
-        # Sometimes sym_name == demangled_name, sometimes not; keep both.
-        per_file[file].append(
-            {
-                "addr": addr,
-                "sym_name": sym_name,
-                "func_name": demangled_name,
-                "line": line,
-            }
-        )
+        func_name, file, line = info[addr]
+        records.append((file, line, addr, sym_name, func_name))
+    records.sort()
 
     # Pretty print
-    for file, entries in sorted(per_file.items()):
+    for file, entries in groupby(records, key=itemgetter(0)):
         print(f"File: {file}")
-        for e in sorted(entries, key=lambda x: (x["line"], x["addr"])):
-            name_display = e["func_name"]
-            if e["func_name"] != e["sym_name"]:
-                name_display += f"  (symbol: {e['sym_name']})"
-            line_info = f":{e['line']}" if e["line"] else ""
-            print(f"  {name_display}{line_info}  @ {e['addr']}")
+        for _, line, addr, sym_name, func_name in entries:
+            name_display = func_name
+            if func_name != sym_name:
+                name_display += f"  (symbol: {sym_name})"
+            line_info = f":{line}" if line else ""
+            print(f"  {name_display}{line_info}  @ {addr}")
         print()
 
 
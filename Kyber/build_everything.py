@@ -6,6 +6,7 @@ Builds all of the binaries without flashing them.
 from interface import *
 from mupq import mupq
 
+import atexit
 import sys
 import json
 import time
@@ -19,10 +20,10 @@ LOG_PATH = Path("build_trace.jsonl")
 if LOG_PATH.exists():
     LOG_PATH.unlink()
 
-# --- Save original subprocess functions so we can call them later ---
-_original_run = subprocess.run
-_original_check_call = subprocess.check_call
-_original_check_output = subprocess.check_output
+# One line-buffered handle for the whole run instead of reopening the log
+# for every logged command.
+_log_fh = LOG_PATH.open("a", buffering=1)
+atexit.register(_log_fh.close)
 
 
 def _log_entry(cmd_list, cwd, env):
@@ -33,119 +34,36 @@ def _log_entry(cmd_list, cwd, env):
         "cmd": cmd_list,
         "env": {k: (env or os.environ).get(k, "") for k in ("PATH", "PLATFORM", "SCHEME")},
     }
-    with LOG_PATH.open("a") as f:
-        f.write(json.dumps(entry) + "\n")
+    _log_fh.write(json.dumps(entry) + "\n")
 
     # Optional console echo so you see what’s going on
     print("[build_everything] running:", " ".join(cmd_list))
 
 
-def run_logged(cmd, cwd=None, env=None, **kwargs):
-    """
-    Core logger: normalize cmd, log, then call the ORIGINAL subprocess.run.
-    """
-    if isinstance(cmd, str):
-        cmd_list = cmd.split()
-    else:
-        cmd_list = list(cmd)
-
-    _log_entry(cmd_list, cwd, env)
+def _norm_cmd(cmd):
+    """Normalize a Popen-style args value to a list of str for logging."""
+    if isinstance(cmd, (str, bytes, os.PathLike)):
+        return os.fsdecode(cmd).split()
+    return [os.fsdecode(a) if isinstance(a, (bytes, os.PathLike)) else str(a) for a in cmd]
 
-    # Use the *original* run to avoid infinite recursion
-    return _original_run(cmd_list, cwd=cwd, env=env, **kwargs)
 
-
-def logged_run(*args, **kwargs):
-    """
-    Replacement for subprocess.run that passes through run_logged.
-    Mirrors the subprocess.run(...) API.
+class LoggedPopen(subprocess.Popen):
     """
-    # subprocess.run(args, *, stdin=None, input=None, ...)
-    if "args" in kwargs:
-        cmd = kwargs["args"]
-    elif args:
-        cmd = args[0]
-        args = args[1:]
-    else:
-        raise TypeError("logged_run() missing required argument 'args'")
-
-    cwd = kwargs.get("cwd")
-    env = kwargs.get("env")
+    subprocess.Popen that logs every command before starting it.
 
-    kwargs2 = dict(kwargs)
-    kwargs2.pop("args", None)
-    kwargs2.pop("cwd", None)
-    kwargs2.pop("env", None)
-
-    # Call our logger (which will call _original_run)
-    return run_logged(cmd, cwd=cwd, env=env, **kwargs2)
-
-
-def logged_check_call(*args, **kwargs):
+    subprocess.run, call, check_call and check_output all create their
+    process through the module-level subprocess.Popen, so replacing just
+    this one class logs every command exactly once, including code that
+    uses Popen directly.
     """
-    Replacement for subprocess.check_call that logs and then calls the original.
-    """
-    if "args" in kwargs:
-        cmd = kwargs["args"]
-    elif args:
-        cmd = args[0]
-        args = args[1:]
-    else:
-        raise TypeError("logged_check_call() missing required argument 'args'")
-
-    cwd = kwargs.get("cwd")
-    env = kwargs.get("env")
-
-    kwargs2 = dict(kwargs)
-    kwargs2.pop("args", None)
-    kwargs2.pop("cwd", None)
-    kwargs2.pop("env", None)
-
-    # Normalize cmd for logging but pass the original object to check_call
-    if isinstance(cmd, str):
-        cmd_list = cmd.split()
-    else:
-        cmd_list = list(cmd)
-
-    _log_entry(cmd_list, cwd, env)
-
-    return _original_check_call(cmd, cwd=cwd, env=env, **kwargs2)
-
-
-def logged_check_output(*args, **kwargs):
-    """
-    Replacement for subprocess.check_output that logs and then calls the original.
-    """
-    if "args" in kwargs:
-        cmd = kwargs["args"]
-    elif args:
-        cmd = args[0]
-        args = args[1:]
-    else:
-        raise TypeError("logged_check_output() missing required argument 'args'")
-
-    cwd = kwargs.get("cwd")
-    env = kwargs.get("env")
-
-    kwargs2 = dict(kwargs)
-    kwargs2.pop("args", None)
-    kwargs2.pop("cwd", None)
-    kwargs2.pop("env", None)
-
-    if isinstance(cmd, str):
-        cmd_list = cmd.split()
-    else:
-        cmd_list = list(cmd)
-
-    _log_entry(cmd_list, cwd, env)
 
-    return _original_check_output(cmd, cwd=cwd, env=env, **kwargs2)
+    def __init__(self, args, *posargs, **kwargs):
+        _log_entry(_norm_cmd(args), kwargs.get("cwd"), kwargs.get("env"))
+        super().__init__(args, *posargs, **kwargs)
 
 
 # --- Monkey-patch subprocess so everyone (interface.py, mupq, etc.) is logged ---
-subprocess.run = logged_run
-subprocess.check_call = logged_check_call
-subprocess.check_output = logged_check_output
+subprocess.Popen = LoggedPopen
 
 
 if __name__ == "__main__":
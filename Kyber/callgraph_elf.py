@@ -1,10 +1,27 @@
 #!/usr/bin/env python3
 import argparse
+import gzip
 import subprocess
 from collections import defaultdict, deque
+from functools import lru_cache
 from pathlib import Path
+import io
+import os
+import json
 import re
 
+from analyze_cache import cache_load, cache_store
+
+try:
+    import orjson  # optional, faster JSON for large trace/step data
+except ImportError:
+    orjson = None
+
+try:
+    import brotli  # optional, for --html-precompress
+except ImportError:
+    brotli = None
+
 
 def run_cmd(cmd):
     return subprocess.run(
@@ -16,94 +33,223 @@ def run_cmd(cmd):
     ).stdout
 
 
-def build_symbol_table(elf, nm_tool):
-    out = run_cmd([nm_tool, "-C", "--defined-only", "-n", elf])
-    sym2addr = {}
-    addr2sym = {}
-    for line in out.splitlines():
-        line = line.strip()
-        if not line:
-            continue
-        parts = line.split()
-        if len(parts) < 3:
-            continue
-        addr_str, typecode, name = parts[0], parts[1], parts[2]
-        if typecode.upper() in ("T", "W"):
-            addr = "0x" + addr_str.lstrip("0x")
-            sym2addr[name] = addr
-            addr2sym[addr] = name
-    return sym2addr, addr2sym
+def run_cmd_stream(cmd):
+    """
+    Like run_cmd, but yield stdout line by line while the tool is still
+    running instead of buffering the whole output.
+    """
+    with subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        bufsize=1,
+    ) as proc:
+        yield from proc.stdout
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+
+# A disassembly line is either a function header ("00001234 <func>:") or
+# an instruction mentioning jal/jalr whose first "<...>" names the callee.
+OBJDUMP_LINE_RE = re.compile(
+    r"[ \t]*(?:([0-9a-fA-F]+)[ \t]+<([^>]+)>:|[^<]*\bjalr?\b[^<]*<([^>]+)>)"
+)
+
+
+def _objdump_symbol(line, code_sections):
+    """
+    Parse one "objdump -t" line, e.g.
+
+      80000100 g     F .text\t00000024 main
+
+    and return (addr_str, name) if nm would list it as T/t or W/w (defined
+    symbol in a code section, or defined weak non-object symbol), else None.
+    """
+    left, tab, right = line.rstrip("\n").partition("\t")
+    if not tab:
+        return None
+    addr_str, _, rest = left.partition(" ")
+    flags, section = rest[:7], rest[8:]
+    if section == "*UND*" or "d" in flags[5:] or "f" in flags[6:]:
+        return None
+    weak = flags[1:2] == "w" and flags[6:7] != "O"
+    if section not in code_sections and not weak:
+        return None
+    parts = right.split(None, 1)
+    if len(parts) < 2:
+        return None
+    name = parts[1].strip()
+    for vis in (".hidden ", ".protected ", ".internal "):
+        if name.startswith(vis):
+            name = name[len(vis):]
+    if not name:
+        return None
+    return addr_str, name
+
+
+# Cache kind for build_call_graph's parsed result. analyze_cache already
+# keys on its CACHE_VERSION; the suffix here versions this parser on its
+# own, so bump it whenever the objdump parsing below changes.
+CALL_GRAPH_CACHE_KIND = "call_graph/v1"
 
 
 def build_call_graph(elf, objdump_tool):
-    out = run_cmd([objdump_tool, "-d", "-C", elf])
+    """
+    Read the symbol table, the call graph and each function's source
+    location from a single objdump run (-h section headers, -t symbols,
+    -d disassembly, -l line numbers) instead of separate nm, objdump and
+    addr2line passes over the same ELF.
+
+    Returns (sym2addr, addr2sym, cg, addr2file). cg maps each caller to
+    a sorted tuple of its callees, so every traversal sees the same order
+    from run to run; addr2file maps a function's address to the
+    (file, line) objdump printed under its header.
+
+    The result is cached on disk per ELF, objdump version and
+    CALL_GRAPH_CACHE_KIND (see analyze_cache), so re-running on an
+    unchanged ELF skips objdump.
+    """
+    cached = cache_load(elf, CALL_GRAPH_CACHE_KIND, [objdump_tool])
+    if cached is not None:
+        sym2addr, addr2sym, cg, addr2file = cached
+        cg = {caller: tuple(callees) for caller, callees in cg.items()}
+        addr2file = {addr: tuple(loc) for addr, loc in addr2file.items()}
+        return sym2addr, addr2sym, cg, addr2file
+
     cg = defaultdict(set)
     current_func = None
-
-    func_header_re = re.compile(r"^[0-9a-fA-F]+\s+<([^>]+)>:")
-
-    for line in out.splitlines():
-        line = line.rstrip()
-        m = func_header_re.match(line.strip())
-        if m:
-            current_func = m.group(1)
+    current_addr = None
+    addr2file = {}
+    match = OBJDUMP_LINE_RE.match
+
+    code_sections = set()
+    section = None
+    syms = []
+    part = None
+
+    cmd = [objdump_tool, "-d", "-C", "-l", "-t", "-h", "--no-show-raw-insn", elf]
+    for line in run_cmd_stream(cmd):
+        if part != "disasm":
+            if line.startswith("Sections:"):
+                part = "sections"
+            elif line.startswith("SYMBOL TABLE:"):
+                part = "symbols"
+            elif line.startswith("Disassembly of section"):
+                part = "disasm"
+            elif part == "sections":
+                # "  N .name size vma ..." followed by a flags line
+                # (GNU); llvm-objdump instead ends the line with a TEXT type.
+                parts = line.split()
+                if parts and parts[0].isdigit():
+                    section = parts[1]
+                    if parts[-1] == "TEXT":
+                        code_sections.add(section)
+                elif section and "CODE" in line:
+                    code_sections.add(section)
+            elif part == "symbols":
+                sym = _objdump_symbol(line, code_sections)
+                if sym:
+                    syms.append(sym)
             continue
 
-        if current_func is None:
+        # Most instruction lines are neither headers nor calls; two
+        # substring tests reject them far faster than a failed regex match.
+        if "jal" not in line and ">:" not in line:
+            m = None
+        else:
+            m = match(line)
+        if m is None:
+            # With -l, the first unindented "file:line" after a header is
+            # where that function starts (lines before it are "func():").
+            # llvm-objdump prefixes these lines with "; ".
+            if current_addr is not None and line[:1] not in " \t\n":
+                if line.startswith("; "):
+                    line = line[2:]
+                file, ln = _split_file_line(line.split(" (discriminator", 1)[0].rstrip())
+                if ln:
+                    addr2file[current_addr] = (file, ln)
+                    current_addr = None
             continue
-
-        if "jal" in line and "<" in line and ">" in line:
-            callee = line.split("<", 1)[1].split(">", 1)[0].strip()
+        header_addr, header, callee = m.groups()
+        if header is not None:
+            current_func = header
+            current_addr = "0x" + header_addr.lstrip("0x")
+        elif current_func is not None:
+            callee = callee.strip()
             if callee:
                 cg[current_func].add(callee)
 
-    return cg
+    # Same order as "nm -n": by address
+    syms.sort(key=lambda s: (int(s[0], 16), s[1]))
+    sym2addr = {}
+    addr2sym = {}
+    for addr_str, name in syms:
+        addr = "0x" + addr_str.lstrip("0x")
+        sym2addr[name] = addr
+        addr2sym[addr] = name
 
+    cg = {caller: tuple(sorted(callees)) for caller, callees in cg.items()}
+    cache_store(elf, CALL_GRAPH_CACHE_KIND, [objdump_tool], [sym2addr, addr2sym, cg, addr2file])
+    return sym2addr, addr2sym, cg, addr2file
 
-def addr2line_for_symbol(elf, addr, addr2line_tool):
-    out = run_cmd([addr2line_tool, "-C", "-e", elf, addr])
-    lines = out.splitlines()
-    if not lines:
-        return ("??", 0)
-    file_line = lines[-1].strip()
-    if ":" in file_line:
-        file, ln = file_line.rsplit(":", 1)
-        try:
-            ln = int(ln)
-        except ValueError:
-            ln = 0
-    else:
-        file, ln = file_line, 0
+
+def _split_file_line(file_line):
+    file, sep, ln_str = file_line.rpartition(":")
+    if not sep:
+        return file_line, 0
+    ln = int(ln_str) if ln_str.isdigit() else 0
     return (file, ln)
 
 
-def classify_symbol_files(elf, sym2addr, addr2line_tool, project_root):
+@lru_cache(maxsize=None)
+def _resolve(file):
+    """
+    Path(file).resolve(), cached: thousands of symbols share a handful of
+    source files and resolve() goes to the filesystem every time. Also
+    used for the project root, which every helper below resolves.
+    """
+    return Path(file).resolve()
+
+
+def classify_symbol_files(sym2addr, addr2file, project_root):
     sym2file = {}
     project_syms = set()
-    proj_root_resolved = project_root.resolve()
+    # Trailing separator so a sibling like "<root>2/" is not a match
+    proj_root_str = os.path.join(str(_resolve(project_root)), "")
 
     for name, addr in sym2addr.items():
-        file, line = addr2line_for_symbol(elf, addr, addr2line_tool)
+        file, line = addr2file.get(addr, ("??", 0))
         sym2file[name] = (file, line)
         try:
-            full = Path(file).resolve()
+            full = _resolve(file)
         except Exception:
             continue
-        if str(full).startswith(str(proj_root_resolved)):
+        if str(full).startswith(proj_root_str):
             project_syms.add(name)
 
     return sym2file, project_syms
 
 
+# (id(cg), root) -> (cg, result); print_tree, generate_dot and
+# write_html_animation all walk the same graph from the same root.
+_bfs_cache = {}
+
+
 def bfs_from_main(cg, root="main"):
     """
-    BFS traversal from root.
+    BFS traversal from root. The result is cached per (cg, root), so the
+    returned containers must be treated as read-only.
 
     Returns:
       - order:  list of visited functions (in BFS order)
       - parents: child -> parent
       - depth: func -> distance from root (0 = root)
     """
+    cached = _bfs_cache.get((id(cg), root))
+    if cached is not None and cached[0] is cg:
+        return cached[1]
+
     visited = set()
     parents = {}
     order = []
@@ -113,23 +259,61 @@ def bfs_from_main(cg, root="main"):
     depth[root] = 0
     q = deque([root])
 
+    # Local aliases keep attribute lookups out of the loop; leaf nodes
+    # fall back to a shared empty tuple instead of a fresh list each time.
+    popleft = q.popleft
+    q_append = q.append
+    order_append = order.append
+    visited_add = visited.add
+    cg_get = cg.get
+    empty = ()
+
     while q:
-        f = q.popleft()
-        order.append(f)
-        for callee in cg.get(f, []):
+        f = popleft()
+        order_append(f)
+        d = depth[f] + 1
+        for callee in cg_get(f, empty):
             if callee not in visited:
-                visited.add(callee)
+                visited_add(callee)
                 parents[callee] = f
-                depth[callee] = depth[f] + 1
-                q.append(callee)
+                depth[callee] = d
+                q_append(callee)
 
     if not order:
         order.append(root)
         depth[root] = 0
 
+    _bfs_cache[(id(cg), root)] = (cg, (order, parents, depth))
     return order, parents, depth
 
 
+def prune_call_graph(cg, root, project_syms=None, max_depth=None):
+    """
+    Return a copy of cg limited to what is worth drawing from root:
+      - project_syms given: external functions are kept as leaves but
+        their callees are not expanded (libc/toolchain internals)
+      - max_depth given: functions at that BFS depth are kept as leaves
+    """
+    pruned = {}
+    depth = {root: 0}
+    q = deque([root])
+    while q:
+        f = q.popleft()
+        if project_syms is not None and f != root and f not in project_syms:
+            continue
+        if max_depth is not None and depth[f] >= max_depth:
+            continue
+        callees = cg.get(f, ())
+        if callees:
+            pruned[f] = callees
+        for callee in callees:
+            if callee not in depth:
+                depth[callee] = depth[f] + 1
+                q.append(callee)
+    return pruned
+
+
+@lru_cache(maxsize=None)
 def module_of_file(file, project_root):
     """
     Classify a source file into a logical module:
@@ -139,13 +323,15 @@ def module_of_file(file, project_root):
       - "hal"      : common/hal-*.c
       - "project"  : any other file under project root
       - "external" : outside project root or unknown
+
+    Cached per (file, project_root), since symbols share source files.
     """
     if file == "??":
         return "external"
 
-    proj_root_resolved = project_root.resolve()
+    proj_root_resolved = _resolve(project_root)
     try:
-        full = Path(file).resolve()
+        full = _resolve(file)
         rel = full.relative_to(proj_root_resolved)
     except Exception:
         return "external"
@@ -172,26 +358,37 @@ def print_tree(elf, cg, sym2file, project_syms, root_func):
     children = defaultdict(list)
     for child, parent in parents.items():
         children[parent].append(child)
+    # print_subtree pushes children onto a stack, so keep them reverse-sorted
+    for kids in children.values():
+        kids.sort(reverse=True)
 
     def is_project(f):
         return f in project_syms
 
-    def print_subtree(f, indent="", seen=None):
-        if seen is None:
-            seen = set()
-        marker = "[P]" if is_project(f) else "[EXT]"
-        file, line = sym2file.get(f, ("??", 0))
-        d = depth.get(f, 0)
-        loc = ""
-        if file != "??":
-            loc = f" ({file}:{line})"
-        print(f"{indent}{marker} [d={d}] {f}{loc}")
-        if f in seen:
-            print(f"{indent}  (recursion/cycle)")
-            return
-        seen.add(f)
-        for c in sorted(children.get(f, [])):
-            print_subtree(c, indent + "  ", seen)
+    def print_subtree(root):
+        # Explicit-stack DFS: no Python recursion (deep call chains can't hit
+        # the recursion limit) and every node is expanded at most once.
+        # Lines are collected and printed in one go at the end.
+        out = []
+        emit = out.append
+        visited = set()
+        stack = [(root, "")]
+        while stack:
+            f, indent = stack.pop()
+            marker = "[P]" if is_project(f) else "[EXT]"
+            file, line = sym2file.get(f, ("??", 0))
+            d = depth.get(f, 0)
+            loc = ""
+            if file != "??":
+                loc = f" ({file}:{line})"
+            emit(f"{indent}{marker} [d={d}] {f}{loc}")
+            if f in visited:
+                emit(f"{indent}  (see above)")
+                continue
+            visited.add(f)
+            child_indent = indent + "  "
+            stack.extend((c, child_indent) for c in children.get(f, ()))
+        print("\n".join(out))
 
     print_subtree(root_func)
 
@@ -203,18 +400,15 @@ def generate_dot(elf, cg, sym2file, project_syms, root_func, project_root):
     if not order:
         return "digraph CallGraph {\\n}"
 
-    proj_root_resolved = project_root.resolve()
-
-    # Determine module for each symbol
-    sym2module = {}
-    for sym in order:
-        file, _ = sym2file.get(sym, ("??", 0))
-        sym2module[sym] = module_of_file(file, project_root)
+    proj_root_resolved = _resolve(project_root)
 
-    # Group symbols by module
+    # Look up each symbol's location once and group symbols by module
+    syminfo = {}
     modules = defaultdict(list)
     for sym in order:
-        modules[sym2module[sym]].append(sym)
+        file, line = sym2file.get(sym, ("??", 0))
+        syminfo[sym] = (file, line)
+        modules[module_of_file(file, project_root)].append(sym)
 
     module_labels = {
         "impl": "Kyber768r1 implementation (core KEM operations)",
@@ -229,7 +423,7 @@ def generate_dot(elf, cg, sym2file, project_syms, root_func, project_root):
         if file == "??":
             return "??"
         try:
-            full = Path(file).resolve()
+            full = _resolve(file)
             return str(full.relative_to(proj_root_resolved))
         except Exception:
             return file
@@ -258,7 +452,7 @@ def generate_dot(elf, cg, sym2file, project_syms, root_func, project_root):
         lines.append("    style=rounded;")
 
         for sym in syms:
-            file, line = sym2file.get(sym, ("??", 0))
+            file, line = syminfo[sym]
             rpath = rel_path(file)
             label_sym = sym
             if rpath != "??":
@@ -281,18 +475,20 @@ def generate_dot(elf, cg, sym2file, project_syms, root_func, project_root):
 
         lines.append("  }")
 
-    # Edges between visited nodes
+    # Edges between visited nodes (set membership; order is a list)
+    visited = set(order)
     for caller in order:
-        for callee in cg.get(caller, []):
-            if callee in order:
+        for callee in cg.get(caller, ()):
+            if callee in visited:
                 lines.append(f'  "{caller}" -> "{callee}";')
 
     lines.append("}")
     return "\n".join(lines)
 
 
-def write_dot(elf, cg, sym2file, project_syms, dot_path, root_func, project_root):
-    dot_text = generate_dot(elf, cg, sym2file, project_syms, root_func, project_root)
+def write_dot(elf, cg, sym2file, project_syms, dot_path, root_func, project_root, dot_text=None):
+    if dot_text is None:
+        dot_text = generate_dot(elf, cg, sym2file, project_syms, root_func, project_root)
     Path(dot_path).write_text(dot_text)
     print(f"Wrote call graph to {dot_path}. Render with:")
     print(f"  dot -Tpng {dot_path} -o callgraph.png")
@@ -300,12 +496,40 @@ def write_dot(elf, cg, sym2file, project_syms, dot_path, root_func, project_root
 
 # ---------- HTML animation output ----------
 
-def _js_escape(s: str) -> str:
-    """Escape a Python string for safe use in JS string literal."""
-    return s.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+def _json_script(elem_id, data):
+    """
+    Embed data as a <script type="application/json"> block for the page to
+    JSON.parse. Every "<" is escaped, so nothing in the data can end the
+    script element early.
+    """
+    if orjson is not None:
+        blob = orjson.dumps(data).decode()
+    else:
+        blob = json.dumps(data)
+    blob = blob.replace("<", "\\u003c")
+    return f'<script id="{elem_id}" type="application/json">{blob}</script>\n'
+
+
+def _json_script_ref(elem_id):
+    """JS expression that reads back a block written by _json_script."""
+    return f'JSON.parse(document.getElementById("{elem_id}").textContent)'
 
 
-def write_html_animation(elf, cg, sym2file, project_syms, html_path, root_func, project_root):
+def _write_precompressed(html_path, data):
+    """
+    Write .gz (and .br if brotli is installed) copies of the page next to
+    it, for static servers that serve precompressed files as-is.
+    """
+    gz_path = html_path.with_name(html_path.name + ".gz")
+    gz_path.write_bytes(gzip.compress(data, 9))
+    print(f"Wrote {gz_path}")
+    if brotli is not None:
+        br_path = html_path.with_name(html_path.name + ".br")
+        br_path.write_bytes(brotli.compress(data, quality=11))
+        print(f"Wrote {br_path}")
+
+
+def write_html_animation(elf, cg, sym2file, project_syms, html_path, root_func, project_root, dot_text=None, precompress=False):
     """
     Generate an HTML file that:
       - Uses Viz.js to render the same DOT as the PNG (same layout/structure)
@@ -327,35 +551,38 @@ def write_html_animation(elf, cg, sym2file, project_syms, html_path, root_func,
         print(f"[!] No calls found from {root_func}, not writing HTML.")
         return
 
-    dot_text = generate_dot(elf, cg, sym2file, project_syms, root_func, project_root)
-    dot_js = _js_escape(dot_text)
+    if dot_text is None:
+        dot_text = generate_dot(elf, cg, sym2file, project_syms, root_func, project_root)
 
     # Edge order for animation, in BFS caller order
-    edge_keys = []
-    for caller in order:
-        for callee in cg.get(caller, []):
-            if callee in order:
-                edge_keys.append(f"{caller}->{callee}")
+    visited = set(order)
+    edge_keys = [
+        f"{caller}->{callee}"
+        for caller in order
+        for callee in cg.get(caller, ())
+        if callee in visited
+    ]
 
     elf_name = Path(elf).name
     html_path = Path(html_path)
 
     # Map symbol -> "relative/path/file.c:line" for copyable paths
-    proj_root_resolved = project_root.resolve()
+    proj_root_resolved = _resolve(project_root)
     sym2path = {}
     for sym, (file, line) in sym2file.items():
         if file == "??":
             sym2path[sym] = "??"
         else:
             try:
-                full = Path(file).resolve()
+                full = _resolve(file)
                 rel = full.relative_to(proj_root_resolved)
                 sym2path[sym] = f"{rel}:{line}"
             except Exception:
                 sym2path[sym] = f"{file}:{line}"
+    sym2info = {sym: {"name": sym, "path": path} for sym, path in sym2path.items()}
 
-
-    with html_path.open("w") as f:
+    # Assemble the page in memory and write the file in one go
+    with io.StringIO() as f:
         f.write("<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\" />\n")
         f.write(f"<title>Call graph animation for {elf_name}</title>\n")
         f.write("<style>\n")
@@ -501,23 +728,17 @@ def write_html_animation(elf, cg, sym2file, project_syms, html_path, root_func,
             '<script src="https://cdn.jsdelivr.net/npm/svg-pan-zoom@3.6.1/dist/svg-pan-zoom.min.js"></script>\n'
         )
 
-        # JS: data + logic
+        # Data as JSON blocks (cheaper for the browser to parse than JS
+        # literals), then the logic that reads them
+        f.write(_json_script("dot-src", dot_text))
+        f.write(_json_script("edge-order", edge_keys))
+        f.write(_json_script("sym-info", sym2info))
         f.write("<script>\n")
-        f.write(f'const dotSrc = "{dot_js}";\n')
-        f.write("const edgeOrder = [\n")
-        for key in edge_keys:
-            f.write(f'  "{_js_escape(key)}",\n')
-        f.write("];\n")
+        f.write(f"const dotSrc = {_json_script_ref('dot-src')};\n")
+        f.write(f"const edgeOrder = {_json_script_ref('edge-order')};\n")
 
         # JS mapping: symbol -> { name, path }
-        f.write("const sym2Info = {\n")
-        for sym, path in sym2path.items():
-            f.write(
-                f'  "{_js_escape(sym)}": {{ '
-                f'name: "{_js_escape(sym)}", '
-                f'path: "{_js_escape(str(path))}" }},\n'
-            )
-        f.write("};\n")
+        f.write(f"const sym2Info = {_json_script_ref('sym-info')};\n")
 
 
         # --- Zoom compensation for controls ---
@@ -525,16 +746,19 @@ def write_html_animation(elf, cg, sym2file, project_syms, html_path, root_func,
 // Keep the control buttons readable when the user zooms the page
 let basePixelRatio = window.devicePixelRatio || 1;
 let baseControlsFontSize = null;
+let controlsEl = null;
+let zoomFrame = 0;
 
 function initZoomCompensation() {
     const controls = document.getElementById('controls');
     if (!controls) return;
+    controlsEl = controls;
     const computed = window.getComputedStyle(controls);
     baseControlsFontSize = parseFloat(computed.fontSize) || 14;
 }
 
 function applyZoomCompensation() {
-    const controls = document.getElementById('controls');
+    const controls = controlsEl;
     if (!controls || baseControlsFontSize === null) return;
 
     const ratio = (window.devicePixelRatio || 1) / basePixelRatio;
@@ -553,18 +777,30 @@ window.addEventListener('load', () => {
     applyZoomCompensation();
 });
 
-// devicePixelRatio usually changes on zoom and triggers resize
-window.addEventListener('resize', applyZoomCompensation);
+// devicePixelRatio usually changes on zoom and triggers resize; a zoom
+// fires many resize events, so restyle at most once per frame
+window.addEventListener('resize', () => {
+    if (zoomFrame) return;
+    zoomFrame = requestAnimationFrame(() => {
+        zoomFrame = 0;
+        applyZoomCompensation();
+    });
+});
 """)
 
         f.write(r"""
 let viz = new Viz();
 let edgeElements = [];
+let edgeRed = new Uint8Array(0);         // per edge: 1 = drawn in red (current/animating)
+let edgeDiscovered = new Uint8Array(0);  // per edge: 1 = already drawn
+let edgeApplied = new Uint8Array(0);     // per edge: stroke/visibility last set by updateNeighborHighlights, 0 = unknown
+let firstOutgoingEdge = new Map();  // caller -> index of its first edge in edgeElements
 let currentIndex = -1;        // index of the "current" edge in animation order
 let playingDirection = null;  // "forward" | "backward" | null
 let speed = 1.0;
 let panZoom = null;
 let svgRoot = null;
+let scratchPt = null;     // reused SVGPoint for screen-space transforms
 let followLine = false;
 
 // Node selection + neighbor highlighting state
@@ -573,9 +809,12 @@ let showOutgoing = true;
 let showIncoming = false;
 
 let nodeMap = {};   // symbol -> <g.node> (global so all functions can use it)
+let nodeShapes = {}; // symbol -> border shapes of that node
+let nodeStyles = null; // symbol -> border color set by updateNeighborHighlights; null = unknown
 
 function setupGraphAnimation(svgElement) {
     svgRoot = svgElement;
+    scratchPt = svgElement.createSVGPoint ? svgElement.createSVGPoint() : null;
 
     // Enable pan/zoom with visible control icons, but disable dbl-click zoom
     panZoom = svgPanZoom(svgElement, {
@@ -586,6 +825,7 @@ function setupGraphAnimation(svgElement) {
 
     // Map from symbol -> node <g> for search/focus
     nodeMap = {};
+    nodeShapes = {};
 
     // Map Graphviz edges by title "caller->callee"
     const edgeGroupsByKey = {};
@@ -614,12 +854,28 @@ function setupGraphAnimation(svgElement) {
         // prepare for "draw line" animation
         path.setAttribute('stroke-dasharray', length);
         path.setAttribute('stroke-dashoffset', length);
-        path.setAttribute('data-base-color', '#aaaaaa');
-        path.setAttribute('data-discovered', '0'); // 0 = not discovered yet
 
-        return { key, group: g, path, length };
+        // caller/callee are read on every highlight update; split the title once.
+        // Titles that do not split into exactly two names never match a node.
+        const parts = key.split("->");
+        const caller = parts.length === 2 ? parts[0] : null;
+        const callee = parts.length === 2 ? parts[1] : null;
+
+        return { key, group: g, path, length, caller, callee };
     }).filter(e => e !== null);
 
+    // Animation state per edge, indexed like edgeElements: grey and not discovered yet
+    edgeRed = new Uint8Array(edgeElements.length);
+    edgeDiscovered = new Uint8Array(edgeElements.length);
+    edgeApplied = new Uint8Array(edgeElements.length);
+
+    firstOutgoingEdge = new Map();
+    edgeElements.forEach((e, i) => {
+        if (e.caller !== null && !firstOutgoingEdge.has(e.caller)) {
+            firstOutgoingEdge.set(e.caller, i);
+        }
+    });
+
     // Initially: nothing discovered
     highlightEdges(-1);
 
@@ -774,6 +1030,8 @@ function setupGraphAnimation(svgElement) {
         const sym = titleEl.textContent.trim();
 
         nodeMap[sym] = node;
+        nodeShapes[sym] = Array.from(node.querySelectorAll('ellipse,polygon,rect'));
+        nodeStyles = null;
 
         node.style.cursor = 'pointer';
 
@@ -807,14 +1065,15 @@ function setupGraphAnimation(svgElement) {
         });
     });
 
-    // Fill dropdown suggestions
+    // Fill dropdown suggestions (built off-document, attached in one go)
     if (searchList) {
-        searchList.innerHTML = "";
-        Object.keys(nodeMap).sort().forEach(sym => {
+        const frag = document.createDocumentFragment();
+        for (const sym of Object.keys(nodeMap).sort()) {
             const opt = document.createElement('option');
             opt.value = sym;
-            searchList.appendChild(opt);
-        });
+            frag.appendChild(opt);
+        }
+        searchList.replaceChildren(frag);
     }
 
     // Search by name, highlight node + its edges and jump to it
@@ -864,16 +1123,8 @@ function setupGraphAnimation(svgElement) {
 function continueFromNode(sym) {
     if (!edgeElements.length) return;
 
-    let idx = -1;
-    for (let i = 0; i < edgeElements.length; i++) {
-        const e = edgeElements[i];
-        if (!e || !e.key) continue;
-        if (e.key.startsWith(sym + "->")) {
-            idx = i;
-            break;
-        }
-    }
-    if (idx === -1) {
+    const idx = firstOutgoingEdge.get(sym);
+    if (idx === undefined) {
         return; // no outgoing edges from this symbol
     }
 
@@ -897,19 +1148,23 @@ function focusOnEdge(index) {
 
     try {
         const path   = e.path;
-        const length = e.length;
 
-        // Midpoint of the edge in the path's coordinate system
-        const mid = path.getPointAtLength(length / 2);
+        // Midpoint of the edge in the path's coordinate system; the path
+        // never changes, so look it up once per edge
+        if (e.midX === undefined) {
+            const mid = path.getPointAtLength(e.length / 2);
+            e.midX = mid.x;
+            e.midY = mid.y;
+        }
 
         // Need SVGPoint to transform to screen coordinates
-        if (!svgRoot.createSVGPoint) {
+        if (!scratchPt) {
             return; // give up gracefully on very old browsers
         }
 
-        const pt = svgRoot.createSVGPoint();
-        pt.x = mid.x;
-        pt.y = mid.y;
+        const pt = scratchPt;
+        pt.x = e.midX;
+        pt.y = e.midY;
 
         // Transform that point to *screen* coordinates using the element's CTM
         const ctm = path.getScreenCTM();
@@ -948,7 +1203,8 @@ function focusOnNode(node) {
     if (!node || !node.getBBox) return;
 
     const bbox = node.getBBox();
-    const center = svgRoot.createSVGPoint();
+    if (!scratchPt) return;
+    const center = scratchPt;
     center.x = bbox.x + bbox.width / 2;
     center.y = bbox.y + bbox.height / 2;
 
@@ -986,6 +1242,7 @@ function emphasizeNode(node) {
     });
 
     lastHighlightedNode = node;
+    nodeStyles = null;  // borders changed behind updateNeighborHighlights' back
 }
 
 
@@ -1007,12 +1264,9 @@ function updateNeighborHighlights() {
 
     if (selectedNode) {
         edgeElements.forEach((e, i) => {
-            if (!e || !e.path || !e.key) return;
-            const key = e.key;
-            const parts = key.split("->");
-            if (parts.length !== 2) return;
-            const caller = parts[0];
-            const callee = parts[1];
+            if (!e || !e.path || e.caller === null) return;
+            const caller = e.caller;
+            const callee = e.callee;
 
             if (showOutgoing && caller === selectedNode) {
                 outgoingEdgeSet.add(i);
@@ -1030,8 +1284,8 @@ function updateNeighborHighlights() {
         if (!e || !e.path) return;
         const path = e.path;
         const length = e.length;
-        const baseColor = path.getAttribute("data-base-color") || "#aaaaaa";
-        const discovered = path.getAttribute("data-discovered") === "1";
+        const baseColor = edgeRed[i] ? "#ff0000" : "#aaaaaa";
+        const discovered = edgeDiscovered[i] === 1;
         const isOutgoing = outgoingEdgeSet.has(i);
         const isIncoming = incomingEdgeSet.has(i);
         const highlighted = isOutgoing || isIncoming;
@@ -1041,47 +1295,53 @@ function updateNeighborHighlights() {
         //  2. incoming purple
         //  3. outgoing green
         //  4. baseColor (grey)
+        let stroke, kind;
         if (baseColor === "#ff0000") {
-            path.setAttribute("stroke", baseColor);
+            stroke = baseColor; kind = 1;
         } else if (isIncoming) {
-            path.setAttribute("stroke", "#800080"); // purple
+            stroke = "#800080"; kind = 2;  // purple
         } else if (isOutgoing) {
-            path.setAttribute("stroke", "#008000"); // green
+            stroke = "#008000"; kind = 3;  // green
         } else {
-            path.setAttribute("stroke", baseColor);
+            stroke = baseColor; kind = 4;
         }
 
         // Visibility: discovered OR highlighted edges are visible
-        if (discovered || highlighted) {
-            path.setAttribute("stroke-dashoffset", 0);
-        } else {
-            path.setAttribute("stroke-dashoffset", length);
-        }
+        const visible = discovered || highlighted;
+
+        // Each attribute write invalidates style; skip edges that already
+        // show this state (most of them on a single animation step)
+        const applied = kind * 2 + (visible ? 1 : 0);
+        if (edgeApplied[i] === applied) return;
+        edgeApplied[i] = applied;
+
+        path.setAttribute("stroke", stroke);
+        path.setAttribute("stroke-dashoffset", visible ? 0 : length);
     });
 
     // ---- Node colors (new part) ----
-    Object.entries(nodeMap).forEach(([sym, node]) => {
-        const shapes = node.querySelectorAll("ellipse,polygon,rect");
+    // Later entries win: selected over callers over callees.
+    const newStyles = new Map();
+    outgoingNodeSet.forEach(sym => newStyles.set(sym, "#008000"));  // callees: green
+    incomingNodeSet.forEach(sym => newStyles.set(sym, "#800080"));  // callers: purple
+    if (selectedNode) newStyles.set(selectedNode, "#ff9900");      // selected node: orange
+
+    // Only repaint nodes that enter or leave the highlighted sets; this runs
+    // on every animation step, when the sets usually do not change.
+    const dirty = nodeStyles === null
+        ? Object.keys(nodeMap)
+        : new Set([...nodeStyles.keys(), ...newStyles.keys()]);
+    dirty.forEach(sym => {
+        const stroke = newStyles.get(sym);
+        if (nodeStyles !== null && nodeStyles.get(sym) === stroke) return;
+        const shapes = nodeShapes[sym];
+        if (!shapes) return;
         shapes.forEach(s => {
-            // Default border
-            let stroke = "#000000";
-            let strokeWidth = "1";
-
-            if (sym === selectedNode) {
-                stroke = "#ff9900";        // selected node: orange
-                strokeWidth = "3";
-            } else if (incomingNodeSet.has(sym)) {
-                stroke = "#800080";        // callers: purple
-                strokeWidth = "3";
-            } else if (outgoingNodeSet.has(sym)) {
-                stroke = "#008000";        // callees: green
-                strokeWidth = "3";
-            }
-
-            s.setAttribute("stroke", stroke);
-            s.setAttribute("stroke-width", strokeWidth);
+            s.setAttribute("stroke", stroke || "#000000");
+            s.setAttribute("stroke-width", stroke ? "3" : "1");
         });
     });
+    nodeStyles = newStyles;
 }
 
 
@@ -1100,50 +1360,60 @@ function highlightEdges(idx) {
         if (!e || !e.path) return;
         const path = e.path;
         let baseColor = "#aaaaaa";
-        let discovered = "0";
+        let discovered = 0;
 
         if (currentIndex < 0) {
             // Initial: nothing discovered
             baseColor = "#aaaaaa";
-            discovered = "0";
+            discovered = 0;
         } else if (i === currentIndex) {
             // current edge: red + discovered
             baseColor = "#ff0000";
-            discovered = "1";
+            discovered = 1;
         } else if (i < currentIndex) {
             // older than current: grey + discovered
             baseColor = "#aaaaaa";
-            discovered = "1";
+            discovered = 1;
         } else {
             // future edges: grey + not discovered
             baseColor = "#aaaaaa";
-            discovered = "0";
+            discovered = 0;
         }
 
-        path.setAttribute("stroke", baseColor);
-        path.setAttribute("data-base-color", baseColor);
-        path.setAttribute("data-discovered", discovered);
+        // stroke itself is applied by updateNeighborHighlights below
+        edgeRed[i] = baseColor === "#ff0000" ? 1 : 0;
+        edgeDiscovered[i] = discovered;
     });
 
     updateNeighborHighlights();
 }
 
+// Manual steps move currentIndex right away, so repeated clicks add up,
+// but the graph is redrawn at most once per frame for the latest index.
+let stepFrame = 0;
+
+function scheduleStep(idx) {
+    currentIndex = idx;
+    if (stepFrame) return;
+    stepFrame = requestAnimationFrame(() => {
+        stepFrame = 0;
+        highlightEdges(currentIndex);
+        focusOnEdge(currentIndex);
+    });
+}
+
 function stepForward() {
     if (edgeElements.length === 0) return;
     if (currentIndex < edgeElements.length - 1) {
-        highlightEdges(currentIndex + 1);
-        focusOnEdge(currentIndex);
+        scheduleStep(currentIndex + 1);
     }
 }
 
 function stepBack() {
     if (edgeElements.length === 0) return;
-    if (currentIndex > 0) {
-        highlightEdges(currentIndex - 1);
-        focusOnEdge(currentIndex);
-    } else if (currentIndex === 0) {
-        // go back to "no edge selected"
-        highlightEdges(-1);
+    if (currentIndex >= 0) {
+        // from the first edge this goes back to "no edge selected"
+        scheduleStep(currentIndex - 1);
     }
 }
 
@@ -1163,13 +1433,14 @@ function animateEdge(index, direction, onDone) {
     const length = e.length;
 
     const baseDuration = 900; // ms
-    const totalSteps   = 40;
-    const interval     = baseDuration / (speed * totalSteps);
-    let t = 0;
+    const duration     = baseDuration / speed;
+    let start = null;
+    let lastOffset = null;    // last dashoffset written by tick()
 
     // ensure current line is red while animating
     path.setAttribute("stroke", "#ff0000");
-    path.setAttribute("data-base-color", "#ff0000");
+    edgeRed[index] = 1;
+    edgeApplied[index] = 0;  // stroke/dashoffset are driven from here until done
     path.setAttribute("stroke-dasharray", length);
 
     // starting dashoffset depends on direction
@@ -1181,43 +1452,45 @@ function animateEdge(index, direction, onDone) {
         path.setAttribute("stroke-dashoffset", 0);
     }
 
-    const timer = setInterval(() => {
+    // One step per display frame; progress follows elapsed time, so the
+    // speed is the same on any refresh rate and hidden tabs do no work
+    function tick(now) {
         // stop if user changed direction or paused
         if (playingDirection !== direction) {
-            clearInterval(timer);
             onDone(false);
             return;
         }
 
-        t++;
-        const alpha = t / totalSteps;
+        if (start === null) start = now;
+        const alpha = Math.min(1, (now - start) / duration);
+        edgeApplied[index] = 0;  // dashoffset changes below, behind updateNeighborHighlights
 
-        if (direction === "forward") {
-            // draw line progressively
-            const offset = length * (1 - alpha);
-            path.setAttribute("stroke-dashoffset", offset);
-        } else {
-            // erase line progressively
-            const offset = length * alpha;
+        // draw (forward) or erase (backward) the line progressively; on
+        // short edges or slow speeds many frames move it by under half a
+        // pixel, so those writes are skipped
+        const offset = direction === "forward" ? length * (1 - alpha) : length * alpha;
+        if (lastOffset === null || Math.abs(offset - lastOffset) >= 0.5) {
             path.setAttribute("stroke-dashoffset", offset);
+            lastOffset = offset;
         }
 
-        if (t >= totalSteps) {
-            clearInterval(timer);
-
+        if (alpha < 1) {
+            requestAnimationFrame(tick);
+        } else {
             if (direction === "forward") {
                 // final: fully drawn
                 path.setAttribute("stroke-dashoffset", 0);
-                path.setAttribute("data-discovered", "1");
+                edgeDiscovered[index] = 1;
             } else {
                 // final: fully hidden
                 path.setAttribute("stroke-dashoffset", length);
-                path.setAttribute("data-discovered", "0");
+                edgeDiscovered[index] = 0;
             }
 
             onDone(true);
         }
-    }, interval);
+    }
+    requestAnimationFrame(tick);
 }
 
 function runAnimationForward() {
@@ -1280,8 +1553,12 @@ viz.renderSVGElement(dotSrc)
 """)
         f.write("</script>\n")
         f.write("</body>\n</html>\n")
-
+        data = f.getvalue().encode("utf-8")
+    html_path.write_bytes(data)
     print(f"Wrote animated HTML to {html_path}")
+
+    if precompress:
+        _write_precompressed(html_path, data)
     print("Open it in a browser (with internet access for the JS libs) to watch the calls animate.")
 
 
@@ -1293,23 +1570,35 @@ def main():
     ap.add_argument(
         "--nm-tool",
         default="riscv32-unknown-elf-nm",
-        help="nm executable (default: riscv32-unknown-elf-nm)",
+        help="Unused, kept for compatibility: symbols are read from objdump -t",
     )
     ap.add_argument(
         "--objdump-tool",
         default="riscv32-unknown-elf-objdump",
-        help="objdump executable (default: riscv32-unknown-elf-objdump)",
+        help="objdump executable (default: riscv32-unknown-elf-objdump). "
+        "llvm-objdump is faster and also accepted, but it does not name the "
+        "target of auipc+jalr calls, so unrelaxed and far calls are missed",
     )
     ap.add_argument(
         "--addr2line-tool",
         default="riscv32-unknown-elf-addr2line",
-        help="addr2line executable (default: riscv32-unknown-elf-addr2line)",
+        help="Unused, kept for compatibility: source locations are read from objdump -l",
     )
     ap.add_argument(
         "--root-func",
         default="main",
         help="Root function for the call graph (default: main)",
     )
+    ap.add_argument(
+        "--prune-ext",
+        action="store_true",
+        help="Show external (non-project) functions as leaves without expanding their calls",
+    )
+    ap.add_argument(
+        "--max-depth",
+        type=int,
+        help="Do not expand calls below this depth from the root function",
+    )
     ap.add_argument(
         "--dot",
         help="Graphviz .dot output file for the call graph",
@@ -1318,6 +1607,11 @@ def main():
         "--html",
         help="HTML file for animated call graph visualization",
     )
+    ap.add_argument(
+        "--html-precompress",
+        action="store_true",
+        help="Also write <html>.gz (and <html>.br if brotli is installed) for static web servers",
+    )
     args = ap.parse_args()
 
     elf = Path(args.elf).resolve()
@@ -1327,20 +1621,32 @@ def main():
 
     project_root = Path(".").resolve()
 
-    sym2addr, addr2sym = build_symbol_table(str(elf), args.nm_tool)
-    cg = build_call_graph(str(elf), args.objdump_tool)
+    sym2addr, addr2sym, cg, addr2file = build_call_graph(str(elf), args.objdump_tool)
     sym2file, project_syms = classify_symbol_files(
-        str(elf), sym2addr, args.addr2line_tool, project_root
+        sym2addr, addr2file, project_root
     )
 
+    if args.prune_ext or args.max_depth is not None:
+        cg = prune_call_graph(
+            cg, args.root_func,
+            project_syms if args.prune_ext else None,
+            args.max_depth,
+        )
+
     print(f"ELF: {elf}\n")
     print_tree(str(elf), cg, sym2file, project_syms, args.root_func)
 
+    # The DOT text is shared by the .dot file and the HTML page; build it once.
+    dot_text = None
+    if args.dot or args.html:
+        dot_text = generate_dot(str(elf), cg, sym2file, project_syms, args.root_func, project_root)
+
     if args.dot:
-        write_dot(str(elf), cg, sym2file, project_syms, args.dot, args.root_func, project_root)
+        write_dot(str(elf), cg, sym2file, project_syms, args.dot, args.root_func, project_root, dot_text=dot_text)
 
     if args.html:
-        write_html_animation(str(elf), cg, sym2file, project_syms, args.html, args.root_func, project_root)
+        write_html_animation(str(elf), cg, sym2file, project_syms, args.html, args.root_func, project_root, dot_text=dot_text,
+                             precompress=args.html_precompress)
 
 
 if __name__ == "__main__":